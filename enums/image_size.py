@@ -13,10 +13,12 @@ class ImageSize(Enum):
 
     @classmethod
     def get_dimensions(cls, size: "ImageSize") -> Optional[Tuple[int, int]]:
-        dimensions = {
-            cls.SMALL: (1280, 720),
-            cls.MEDIUM: (1920, 1080),
-            cls.LARGE: (2560, 1440),
-            cls.HUGE: (5000, 5000)
-        }
-        return dimensions.get(size)
+        return _DIMENSIONS.get(size)
+
+
+_DIMENSIONS = {
+    ImageSize.SMALL: (1280, 720),
+    ImageSize.MEDIUM: (1920, 1080),
+    ImageSize.LARGE: (2560, 1440),
+    ImageSize.HUGE: (5000, 5000),
+}
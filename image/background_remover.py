@@ -1,33 +1,246 @@
+import cv2
+import hashlib
 import numpy as np
 import logging
-from PIL import Image
-from rembg import remove
+import threading
+from collections import OrderedDict
+from typing import Callable, Tuple
 from aiogram import types
 from .image_handler import ImageHandler
+from .optional_import import optional_import
 from enums.image_size import ImageSize
 
-
 logger = logging.getLogger(__name__)
 
 
 class BackgroundRemover(ImageHandler):
     """Handles background removal from images."""
 
+    # Longest edge of the image handed to rembg.remove
+    REMBG_MAX_EDGE = 1024
+
+    # Models sharing U2Net's 320x320 input and ImageNet normalization, which
+    # are run directly on the session instead of through rembg.remove
+    U2NET_MODELS = {"u2net", "u2netp", "u2net_human_seg", "silueta"}
+    U2NET_INPUT_SIZE = (320, 320)
+    U2NET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(1, 3, 1, 1)
+    U2NET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(1, 3, 1, 1)
+
+    # Model masks kept for re-requests of the same upload at another size
+    MASK_CACHE_SIZE = 32
+
+    # ONNX Runtime providers for rembg, in order of preference
+    REMBG_PROVIDERS = [
+        "CUDAExecutionProvider",
+        "OpenVINOExecutionProvider",
+        "CPUExecutionProvider",
+    ]
+
+    def __init__(self, model_name: str = "u2netp"):
+        self.model_name = model_name
+        self._rembg_session = None
+        self._session_lock = threading.Lock()
+        self._mask_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._use_cuda = None
+
+    def _get_session(self):
+        """Load rembg and its model on first use, keeping them out of bot startup."""
+        with self._session_lock:
+            if self._rembg_session is None:
+                from onnxruntime import get_available_providers
+                from rembg import new_session
+
+                available = set(get_available_providers())
+                self._rembg_session = new_session(
+                    model_name=self.model_name,
+                    providers=[p for p in self.REMBG_PROVIDERS if p in available],
+                )
+            return self._rembg_session
+
+    def _cuda_available(self) -> bool:
+        """Whether U2Net background removal can run on a CUDA device via torch."""
+        if self._use_cuda is None:
+            torch = (
+                optional_import("torch") if self.model_name in self.U2NET_MODELS else None
+            )
+            self._use_cuda = bool(torch and torch.cuda.is_available())
+        return self._use_cuda
+
+    def _cached_mask(self, key: bytes, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Return the model mask for an upload, running the model only on a miss."""
+        with self._cache_lock:
+            mask = self._mask_cache.get(key)
+            if mask is not None:
+                self._mask_cache.move_to_end(key)
+                return mask
+
+        mask = compute()
+        mask.setflags(write=False)
+        with self._cache_lock:
+            self._mask_cache[key] = mask
+            if len(self._mask_cache) > self.MASK_CACHE_SIZE:
+                self._mask_cache.popitem(last=False)
+        return mask
+
+    def _run_u2net(self, blob: np.ndarray) -> np.ndarray:
+        """Run U2Net on a normalized 1x3x320x320 RGB blob, returning a 0-255 mask."""
+        ort_session = self._get_session().inner_session
+        input_name = ort_session.get_inputs()[0].name
+        pred = ort_session.run(None, {input_name: blob})[0][0, 0]
+        low, high = float(pred.min()), float(pred.max())
+        return (pred - low) * (255.0 / max(high - low, 1e-6))
+
+    def _u2net_blob(self, image: np.ndarray) -> np.ndarray:
+        """Build U2Net's normalized 1x3x320x320 RGB input from a BGR image."""
+        small = cv2.resize(image, self.U2NET_INPUT_SIZE, interpolation=cv2.INTER_AREA)
+        blob = cv2.dnn.blobFromImage(small, swapRB=True)
+        blob /= max(float(blob.max()), 1e-6)
+        blob -= self.U2NET_MEAN
+        blob /= self.U2NET_STD
+        return blob
+
+    def _predict_u2net_alpha(
+        self, image: np.ndarray, alpha: np.ndarray, key: bytes
+    ) -> None:
+        """Write the U2Net foreground mask for a BGR image into `alpha`."""
+        height, width = image.shape[:2]
+        pred = self._cached_mask(key, lambda: self._run_u2net(self._u2net_blob(image)))
+        alpha[...] = cv2.resize(pred, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    def _remove_background_cuda(
+        self,
+        image: np.ndarray,
+        target_size: ImageSize,
+        source_size: Tuple[int, int],
+        key: bytes,
+    ) -> np.ndarray:
+        """Resize, mask and composite on the GPU, downloading only the final BGRA."""
+        torch = optional_import("torch")
+        torch_f = torch.nn.functional
+        height, width = image.shape[:2]
+        new_width, new_height = self.output_size(*source_size, target_size)
+
+        with torch.no_grad():
+            src = torch.from_numpy(np.ascontiguousarray(image)).cuda(non_blocking=True)
+            bgr = src.permute(2, 0, 1)[None].float()
+            if (new_width, new_height) != (width, height):
+                bgr = torch_f.interpolate(bgr, size=(new_height, new_width), mode="area")
+
+            def predict() -> np.ndarray:
+                small = torch_f.interpolate(
+                    bgr, size=self.U2NET_INPUT_SIZE[::-1], mode="area"
+                )
+                rgb = small.flip(1)
+                rgb /= rgb.max().clamp_min(1e-6)
+                mean = torch.from_numpy(self.U2NET_MEAN).cuda()
+                std = torch.from_numpy(self.U2NET_STD).cuda()
+                return self._run_u2net(((rgb - mean) / std).cpu().numpy())
+
+            # Only the 320x320 input and mask cross PCIe besides the source and result
+            pred = torch.tensor(self._cached_mask(key, predict)).cuda()
+            alpha = torch_f.interpolate(
+                pred[None, None], size=(new_height, new_width), mode="bilinear"
+            )
+            bgra = torch.cat([bgr, alpha], dim=1).round_().clamp_(0, 255)
+            return bgra[0].permute(1, 2, 0).to(torch.uint8).contiguous().cpu().numpy()
+
+    def _rembg_cutout_alpha(self, image: np.ndarray) -> np.ndarray:
+        """Run rembg.remove on a clamped copy of a BGR image and keep its alpha."""
+        from rembg import remove
+
+        height, width = image.shape[:2]
+        pool = self.buffer_pool
+
+        # Feed rembg a clamped copy and only scale the resulting mask back up
+        scale = min(1.0, self.REMBG_MAX_EDGE / max(height, width))
+        small = image
+        if scale < 1.0:
+            small = pool.acquire(
+                (int(height * scale), int(width * scale), 3), image.dtype
+            )
+            cv2.resize(
+                image,
+                (small.shape[1], small.shape[0]),
+                dst=small,
+                interpolation=cv2.INTER_AREA,
+            )
+
+        try:
+            # rembg wants RGB, and only the alpha plane of its output is kept
+            rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            cutout = remove(rgb, session=self._get_session())[..., 3]
+            return np.ascontiguousarray(cutout)
+        finally:
+            if small is not image:
+                pool.release(small)
+
+    def _predict_rembg_alpha(
+        self, image: np.ndarray, alpha: np.ndarray, key: bytes
+    ) -> None:
+        """Write rembg's cutout alpha for a BGR image into `alpha`."""
+        height, width = image.shape[:2]
+        cutout = self._cached_mask(key, lambda: self._rembg_cutout_alpha(image))
+        if cutout.shape[:2] != (height, width):
+            cutout = cv2.resize(
+                cutout,
+                (width, height),
+                interpolation=cv2.INTER_LINEAR,
+            )
+        alpha[...] = cutout
+
+    def _remove_background(self, image_data: bytes, target_size: ImageSize) -> np.ndarray:
+        """Decode once and return the resized cutout as a BGRA array."""
+        key = hashlib.blake2b(image_data, digest_size=16).digest()
+        image, source_size = self.decode_image(
+            image_data, cv2.IMREAD_COLOR, target_size
+        )
+        if image.dtype == np.uint8 and self._cuda_available():
+            try:
+                return self._remove_background_cuda(
+                    image, target_size, source_size, key
+                )
+            except Exception as e:
+                logger.warning(f"CUDA background removal failed, using CPU: {e}")
+
+        image = self.resize_image(
+            image, target_size, pooled=True, source_size=source_size
+        )
+        pool = self.buffer_pool
+
+        # Colour stays as decoded OpenCV BGR end to end; only the alpha plane
+        # comes from the model, written over cvtColor's opaque fill
+        try:
+            output = pool.acquire(image.shape[:2] + (4,), image.dtype)
+            try:
+                cv2.cvtColor(image, cv2.COLOR_BGR2BGRA, dst=output)
+                if self.model_name in self.U2NET_MODELS:
+                    self._predict_u2net_alpha(image, output[..., 3], key)
+                else:
+                    self._predict_rembg_alpha(image, output[..., 3], key)
+            except Exception:
+                pool.release(output)
+                raise
+        finally:
+            pool.release(image)
+        return output
+
     async def process(
-        self, message: types.Message, file_path: str, target_size: ImageSize
+        self, message: types.Message, image_data: bytes, target_size: ImageSize
     ) -> None:
         try:
-            with Image.open(file_path) as img:
-                no_bg = remove(img)
-                image = np.array(no_bg)
-                if target_size != ImageSize.ORIGINAL:
-                    image = self.resize_image(image, target_size)
+            image = await self.run_blocking(
+                self._remove_background, image_data, target_size
+            )
+            try:
                 await self.send_processed_image(
                     message,
                     image,
                     "png",  # Always use PNG for transparency
                     "Background removal",
                 )
+            finally:
+                self.buffer_pool.release(image)
         except Exception as e:
             error_msg = f"🔴 Background Removal Error: {str(e)}"
             logger.error(error_msg)
@@ -0,0 +1,20 @@
+from typing import TYPE_CHECKING, AsyncGenerator
+from aiogram.types import InputFile
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+
+class BufferInputFile(InputFile):
+    """Upload an in-memory buffer in chunks without copying it into bytes first."""
+
+    def __init__(
+        self, data: memoryview, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.data = data
+
+    async def read(self, bot: "Bot") -> AsyncGenerator[memoryview, None]:
+        for offset in range(0, len(self.data), self.chunk_size):
+            yield self.data[offset : offset + self.chunk_size]
@@ -0,0 +1,42 @@
+import threading
+import weakref
+from collections import defaultdict
+from typing import Dict, List, MutableMapping, Tuple
+import numpy as np
+
+
+class BufferPool:
+    """Reusable scratch arrays keyed by exact shape and dtype."""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._free: Dict[Tuple, List[np.ndarray]] = defaultdict(list)
+        # Weak refs to lent arrays: an entry vanishes with its array, so a
+        # reused id never matches, and a buffer that is never released is
+        # still garbage collected
+        self._in_use: MutableMapping[int, np.ndarray] = weakref.WeakValueDictionary()
+        self._pooled_bytes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        """Return a free buffer of the given shape, allocating one if needed."""
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                buffer = free.pop()
+                self._pooled_bytes -= buffer.nbytes
+            else:
+                buffer = np.empty(shape, dtype=dtype)
+            self._in_use[id(buffer)] = buffer
+        return buffer
+
+    def release(self, buffer: np.ndarray) -> None:
+        """Return a buffer to the pool, ignoring arrays the pool didn't hand out."""
+        with self._lock:
+            if self._in_use.get(id(buffer)) is not buffer:
+                return
+            del self._in_use[id(buffer)]
+            if self._pooled_bytes + buffer.nbytes <= self.max_bytes:
+                self._free[(buffer.shape, buffer.dtype)].append(buffer)
+                self._pooled_bytes += buffer.nbytes
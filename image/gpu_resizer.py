@@ -0,0 +1,96 @@
+import logging
+import threading
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+from .optional_import import optional_import
+
+logger = logging.getLogger(__name__)
+
+
+class GpuResizer:
+    """Resizes uint8 images on a CUDA device through CV-CUDA when available."""
+
+    SUPPORTED_CHANNELS = {3, 4}
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._available: Optional[bool] = None
+
+    @property
+    def available(self) -> bool:
+        """Whether CV-CUDA has a CUDA device to run on, checked on first use."""
+        with self._lock:
+            if self._available is None:
+                self._available = False
+                # cvcuda first, so machines without it never pay for torch
+                cvcuda = optional_import("cvcuda")
+                torch = cvcuda and optional_import("torch")
+                if torch and torch.cuda.is_available():
+                    self._cvcuda, self._torch = cvcuda, torch
+                    # CV-CUDA's resize operator has no Lanczos kernel, cubic is the closest
+                    self._interpolations = {
+                        cv2.INTER_AREA: cvcuda.Interp.AREA,
+                        cv2.INTER_LINEAR: cvcuda.Interp.LINEAR,
+                        cv2.INTER_CUBIC: cvcuda.Interp.CUBIC,
+                        cv2.INTER_LANCZOS4: cvcuda.Interp.CUBIC,
+                    }
+                    self._available = True
+                    logger.info("CUDA device found, using CV-CUDA resize backend")
+            return self._available
+
+    def supports(self, image: np.ndarray) -> bool:
+        return (
+            image.dtype == np.uint8
+            and image.ndim == 3
+            and image.shape[2] in self.SUPPORTED_CHANNELS
+            and self.available
+        )
+
+    def _worker_state(self, size: int):
+        """Return this thread's CUDA streams and a pinned host buffer of `size` bytes."""
+        cvcuda, torch = self._cvcuda, self._torch
+        state = self._local
+        if not hasattr(state, "stream"):
+            state.stream = cvcuda.Stream()
+            state.torch_stream = torch.cuda.ExternalStream(state.stream.handle)
+            state.pinned = torch.empty(0, dtype=torch.uint8, pin_memory=True)
+        if state.pinned.numel() < size:
+            state.pinned = torch.empty(size, dtype=torch.uint8, pin_memory=True)
+        return state.stream, state.torch_stream, state.pinned
+
+    def resize(
+        self,
+        image: np.ndarray,
+        size: Tuple[int, int],
+        interpolation: int,
+        dst: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Resize `image` to `size` (width, height) on the GPU.
+
+        The result is written into `dst` when given, otherwise into a new array.
+        """
+        cvcuda, torch = self._cvcuda, self._torch
+        new_width, new_height = size
+        out_shape = (new_height, new_width, image.shape[2])
+        stream, torch_stream, pinned = self._worker_state(int(np.prod(out_shape)))
+        host_out = pinned[: int(np.prod(out_shape))].view(out_shape)
+
+        with stream, torch.cuda.stream(torch_stream):
+            src = torch.from_numpy(np.ascontiguousarray(image)).cuda(non_blocking=True)
+            resized = cvcuda.resize(
+                cvcuda.as_tensor(src, "HWC"),
+                out_shape,
+                self._interpolations.get(interpolation, cvcuda.Interp.CUBIC),
+            )
+            host_out.copy_(
+                torch.as_tensor(resized.cuda(), device="cuda"), non_blocking=True
+            )
+            torch_stream.synchronize()
+
+        # The pinned buffer is reused by the next call on this thread
+        if dst is None:
+            return host_out.numpy().copy()
+        np.copyto(dst, host_out.numpy())
+        return dst
@@ -1,9 +1,9 @@
 import cv2
+import numpy as np
 import logging
 from aiogram import types
 from .image_handler import ImageHandler
 from enums.image_size import ImageSize
-from error.processing_error import ProcessingError
 
 logger = logging.getLogger(__name__)
 
@@ -16,32 +16,66 @@ class ImageConverter(ImageHandler):
     def __init__(self, format_type: str):
         self.format_type = format_type.lower()
 
+    def _prepare_image(self, image_data: bytes, target_size: ImageSize) -> np.ndarray:
+        """Decode, resize and match the image's channels to the target format."""
+        image, source_size = self.decode_image(image_data, target_size=target_size)
+
+        # Handle alpha channel: drop it before resizing and add it after,
+        # so the resize never walks a channel that is thrown away or constant
+        if (
+            self.format_type != "png"
+            and len(image.shape) > 2
+            and image.shape[-1] == 4
+        ):
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+        image = self.resize_image(
+            image, target_size, pooled=True, source_size=source_size
+        )
+
+        if self.format_type == "png" and len(image.shape) > 2 and image.shape[-1] == 3:
+            resized = image
+            image = self.buffer_pool.acquire(resized.shape[:2] + (4,), resized.dtype)
+            # cvtColor fills alpha with the dtype's opaque value (255, 65535, 1.0)
+            cv2.cvtColor(resized, cv2.COLOR_BGR2BGRA, dst=image)
+            self.buffer_pool.release(resized)
+        return image
+
     async def process(
-        self, message: types.Message, file_path: str, target_size: ImageSize
+        self, message: types.Message, image_data: bytes, target_size: ImageSize
     ) -> None:
         try:
-            image = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
-            if image is None:
-                raise ProcessingError("Failed to read image file")
-
-            # Handle alpha channel
-            if self.format_type == "png" and image.shape[-1] == 3:
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
-            elif (
-                self.format_type != "png"
-                and len(image.shape) > 2
-                and image.shape[-1] == 4
-            ):
-                image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
-
-            image = self.resize_image(image, target_size)
-
-            await self.send_processed_image(
-                message,
-                image,
-                self.format_type,
-                f"Conversion to {self.format_type.upper()}",
-            )
+            # Same format at the original size: send the upload back untouched
+            # rather than paying for a (lossy, for JPEG) decode/encode round trip
+            if target_size == ImageSize.ORIGINAL:
+                try:
+                    source_format, size = await self.run_blocking(
+                        self.probe_image, image_data
+                    )
+                except Exception as e:
+                    # Pillow may reject what OpenCV decodes; convert as usual
+                    logger.warning(f"Could not probe image, converting it: {e}")
+                    source_format = None
+                if source_format == self.format_type.replace("jpeg", "jpg"):
+                    await self.send_encoded_image(
+                        message,
+                        memoryview(image_data),
+                        self.format_type,
+                        size,
+                        f"Conversion to {self.format_type.upper()}",
+                    )
+                    return
+
+            image = await self.run_blocking(self._prepare_image, image_data, target_size)
+            try:
+                await self.send_processed_image(
+                    message,
+                    image,
+                    self.format_type,
+                    f"Conversion to {self.format_type.upper()}",
+                )
+            finally:
+                self.buffer_pool.release(image)
 
         except Exception as e:
             error_msg = f"🔴 Conversion Error: {str(e)}"
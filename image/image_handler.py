@@ -1,61 +1,257 @@
+import io
 import os
+import asyncio
+import functools
 import cv2
 import numpy as np
 import logging
 from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from aiogram import types
-from aiogram.types import BufferedInputFile
+from PIL import Image
 from enums.image_size import ImageSize
 from error.processing_error import ProcessingError
+from .buffer_input_file import BufferInputFile
+from .buffer_pool import BufferPool
+from .gpu_resizer import GpuResizer
+from .jpeg_codec import JpegCodec
 
 logger = logging.getLogger(__name__)
 
+_gpu_resizer = GpuResizer()
+_jpeg_codec = JpegCodec()
+
+# Encoder settings, tuned for response latency over output size
+PNG_COMPRESSION = int(os.getenv("PNG_COMPRESSION", "1"))
+JPEG_QUALITY = 95
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "82"))
+
+_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+_ENCODE_PARAMS = {
+    "png": (
+        ".png",
+        [
+            cv2.IMWRITE_PNG_COMPRESSION,
+            PNG_COMPRESSION,
+            cv2.IMWRITE_PNG_STRATEGY,
+            cv2.IMWRITE_PNG_STRATEGY_DEFAULT,
+        ],
+    ),
+    "jpg": (".jpg", _JPEG_PARAMS),
+    "jpeg": (".jpg", _JPEG_PARAMS),
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY]),
+    "bmp": (".bmp", []),
+    "tiff": (".tiff", []),
+}
+
+# Pillow format names that are the same file type as one of ours
+_PROBE_FORMATS = {"jpeg": "jpg", "mpo": "jpg"}
+
+_REDUCED_COLOR_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _target_wh(
+    width: int, height: int, target_width: int, target_height: int
+) -> Tuple[int, int]:
+    """Scale (width, height) to fit the target while keeping the aspect ratio."""
+    aspect = width / height
+    if width > height:
+        new_width = min(width, target_width)
+        return new_width, int(new_width / aspect)
+    new_height = min(height, target_height)
+    return int(new_height * aspect), new_height
+
 
 class ImageHandler(ABC):
     """Abstract base class for image processing operations."""
 
+    # Shared by all handlers so blocking decode/encode work stays off the event loop
+    _io_pool = ThreadPoolExecutor(
+        max_workers=int(os.getenv("WORKER_THREADS", str(os.cpu_count() or 1))),
+        thread_name_prefix="image-worker",
+    )
+    # Scratch arrays reused across requests instead of reallocated per resize
+    buffer_pool = BufferPool()
+    # Downscales smaller than this fraction on both axes are skipped
+    RESIZE_TOLERANCE = 0.05
+    # Largest results still sent as Telegram photos rather than documents
+    PHOTO_MAX_EDGE = 1600
+    PHOTO_MAX_BYTES = 10 * 1024 * 1024
+
     @abstractmethod
     async def process(
-        self, message: types.Message, file_path: str, target_size: ImageSize
+        self, message: types.Message, image_data: bytes, target_size: ImageSize
     ) -> None:
         """Process the image and send the result back to the user."""
         pass
 
-    @staticmethod
-    async def cleanup_files(*file_paths: str) -> None:
-        """Safely clean up temporary files."""
-        for path in file_paths:
-            if path and os.path.exists(path):
-                try:
-                    os.remove(path)
-                    logger.info(f"Cleaned up file: {path}")
-                except Exception as e:
-                    logger.error(f"Failed to clean up {path}: {e}")
-
-    @staticmethod
-    def resize_image(image: np.ndarray, target_size: ImageSize) -> np.ndarray:
-        """Resize image while maintaining aspect ratio and quality."""
-        if target_size == ImageSize.ORIGINAL:
-            return image
+    @classmethod
+    async def run_blocking(cls, func, *args, **kwargs):
+        """Run a blocking call in the shared worker pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            cls._io_pool, functools.partial(func, *args, **kwargs)
+        )
 
+    @classmethod
+    def output_size(
+        cls, width: int, height: int, target_size: ImageSize
+    ) -> Tuple[int, int]:
+        """Return the (width, height) resize_image produces for a source size."""
         target_dims = ImageSize.get_dimensions(target_size)
         if not target_dims:
-            return image
+            return width, height
+
+        new_width, new_height = _target_wh(width, height, *target_dims)
 
-        target_width, target_height = target_dims
+        # Skip resizes that would only shave off a few pixels
+        if (
+            new_width >= width * (1 - cls.RESIZE_TOLERANCE)
+            and new_height >= height * (1 - cls.RESIZE_TOLERANCE)
+            and new_width <= width
+            and new_height <= height
+        ):
+            return width, height
+        return new_width, new_height
+
+    @classmethod
+    def resize_image(
+        cls,
+        image: np.ndarray,
+        target_size: ImageSize,
+        pooled: bool = False,
+        source_size: Optional[Tuple[int, int]] = None,
+    ) -> np.ndarray:
+        """Resize image while maintaining aspect ratio and quality.
+
+        With `pooled`, the result may be a buffer_pool array that the caller
+        must hand back with buffer_pool.release() once it is done with it.
+        `source_size` is the (width, height) decode_image reported; the output
+        size is computed from it, so a reduced JPEG decode ends up at the same
+        size as a full one.
+        """
         height, width = image.shape[:2]
-        aspect = width / height
-        if width > height:
-            new_width = min(width, target_width)
-            new_height = int(new_width / aspect)
-        else:
-            new_height = min(height, target_height)
-            new_width = int(new_height * aspect)
+        new_width, new_height = cls.output_size(
+            *(source_size or (width, height)), target_size
+        )
+        if (new_width, new_height) == (width, height):
+            return image
 
+        # Area filtering is both faster and less aliased when shrinking,
+        # Lanczos is only worth its cost when enlarging
+        downscale = new_width * new_height < width * height
+        interpolation = cv2.INTER_AREA if downscale else cv2.INTER_LANCZOS4
+        out_shape = (new_height, new_width) + image.shape[2:]
+        if _gpu_resizer.supports(image):
+            dst = cls.buffer_pool.acquire(out_shape, image.dtype) if pooled else None
+            try:
+                return _gpu_resizer.resize(
+                    image, (new_width, new_height), interpolation, dst=dst
+                )
+            except Exception as e:
+                if dst is not None:
+                    cls.buffer_pool.release(dst)
+                logger.warning(f"GPU resize failed, falling back to CPU: {e}")
+
+        if not pooled:
+            return cv2.resize(
+                image, (new_width, new_height), interpolation=interpolation
+            )
+
+        dst = cls.buffer_pool.acquire(out_shape, image.dtype)
         return cv2.resize(
-            image, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4
+            image, (new_width, new_height), dst=dst, interpolation=interpolation
         )
 
+    @staticmethod
+    def encode_image(image: np.ndarray, format_type: str) -> memoryview:
+        """Encode image to the given format in memory."""
+        if format_type in ["jpg", "jpeg"]:
+            data = _jpeg_codec.encode(image, JPEG_QUALITY)
+            if data is not None:
+                return memoryview(data)
+
+        ext, params = _ENCODE_PARAMS.get(format_type, (f".{format_type}", []))
+        ok, buffer = cv2.imencode(ext, image, params)
+        if not ok:
+            raise ProcessingError(f"Failed to encode image as {format_type}")
+        # A view over OpenCV's output, not a bytes copy of it
+        return memoryview(buffer.reshape(-1))
+
+    @classmethod
+    def decode_image(
+        cls,
+        data: bytes,
+        flags: int = cv2.IMREAD_UNCHANGED,
+        target_size: ImageSize = ImageSize.ORIGINAL,
+    ) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Decode image bytes, by default keeping any alpha channel.
+
+        Returns the image and the (width, height) of the full-size source,
+        which resize_image needs to size the output after a reduced decode.
+
+        `flags` are OpenCV IMREAD_* flags: IMREAD_UNCHANGED keeps alpha and
+        ignores EXIF orientation, IMREAD_COLOR returns BGR rotated upright
+        per EXIF. Only the former goes through libjpeg-turbo, which never
+        applies EXIF orientation.
+
+        For JPEG input with a smaller `target_size`, the decoder's built-in
+        1/2, 1/4 or 1/8 downscale is used as long as the result still covers
+        the final size, leaving only a small resize for resize_image.
+        No reduced decode is used when output_size would skip the resize.
+        """
+        scale_denom = 1
+        target_dims = ImageSize.get_dimensions(target_size)
+        header_size = _jpeg_codec.header_size(data) if target_dims else None
+        if header_size:
+            width, height = header_size
+            new_width, new_height = cls.output_size(width, height, target_size)
+            scale_denom = next(
+                (
+                    denom
+                    for denom in (8, 4, 2)
+                    if -(-width // denom) >= new_width
+                    and -(-height // denom) >= new_height
+                ),
+                1,
+            )
+
+        image = None
+        if flags == cv2.IMREAD_UNCHANGED:
+            image = _jpeg_codec.decode(data, scale_denom)
+        if image is None:
+            if scale_denom > 1:
+                reduced = _REDUCED_COLOR_FLAGS[scale_denom]
+                if flags == cv2.IMREAD_UNCHANGED:
+                    # IMREAD_UNCHANGED never applied EXIF rotation, keep it that way
+                    reduced |= cv2.IMREAD_IGNORE_ORIENTATION
+                flags = reduced
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+        if image is None:
+            raise ProcessingError("Failed to read image file")
+
+        if scale_denom == 1:
+            height, width = image.shape[:2]
+        elif (image.shape[1] > image.shape[0]) != (width > height):
+            # OpenCV applied an EXIF rotation the header dimensions don't reflect
+            width, height = height, width
+        return image, (width, height)
+
+    @staticmethod
+    def probe_image(data: bytes) -> Tuple[Optional[str], Tuple[int, int]]:
+        """Return the format and (width, height) of image bytes from the header alone."""
+        with Image.open(io.BytesIO(data)) as img:
+            format_type = (img.format or "").lower()
+            # Pillow reports camera JPEGs with an MPF segment as MPO
+            format_type = _PROBE_FORMATS.get(format_type, format_type)
+            return format_type or None, img.size
+
     async def send_processed_image(
         self,
         message: types.Message,
@@ -64,25 +260,39 @@ class ImageHandler(ABC):
         operation_name: str,
     ) -> None:
         """Send processed image back to user with proper format and metadata."""
-        temp_path = f"downloads/temp_output.{format_type}"
         try:
-            if format_type == "png":
-                cv2.imwrite(temp_path, image, [cv2.IMWRITE_PNG_COMPRESSION, 3])
-            elif format_type in ["jpg", "jpeg"]:
-                cv2.imwrite(temp_path, image, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            else:
-                cv2.imwrite(temp_path, image)
+            data = await self.run_blocking(self.encode_image, image, format_type)
+        except Exception as e:
+            raise ProcessingError(f"Failed to send processed image: {str(e)}")
 
-            height, width = image.shape[:2]
+        height, width = image.shape[:2]
+        await self.send_encoded_image(
+            message, data, format_type, (width, height), operation_name
+        )
 
-            async with open(temp_path, "rb") as f:
-                await message.answer_photo(
-                    BufferedInputFile(
-                        await f.read(), filename=f"processed.{format_type}"
-                    ),
-                    caption=f"✅ {operation_name} completed successfully!\nResolution: {width}x{height}",
-                )
+    async def send_encoded_image(
+        self,
+        message: types.Message,
+        data: memoryview,
+        format_type: str,
+        size: Tuple[int, int],
+        operation_name: str,
+    ) -> None:
+        """Send already encoded image bytes back to user."""
+        try:
+            width, height = size
+            file = BufferInputFile(data, filename=f"processed.{format_type}")
+            caption = f"✅ {operation_name} completed successfully!\nResolution: {width}x{height}"
+
+            # Telegram recompresses photos to a lossy, size-capped JPEG, so
+            # send anything it would degrade or reject as a document instead
+            if (
+                format_type in ["jpg", "jpeg"]
+                and max(width, height) <= self.PHOTO_MAX_EDGE
+                and len(data) <= self.PHOTO_MAX_BYTES
+            ):
+                await message.answer_photo(file, caption=caption)
+            else:
+                await message.answer_document(file, caption=caption)
         except Exception as e:
             raise ProcessingError(f"Failed to send processed image: {str(e)}")
-        finally:
-            await self.cleanup_files(temp_path)
@@ -1,7 +1,10 @@
+import io
 import os
+import asyncio
 import logging
-from typing import Dict, Type, Optional
-from aiogram import Bot, Dispatcher, types
+import cv2
+from typing import Dict, Optional
+from aiogram import Bot, Dispatcher, F, types
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
@@ -9,15 +12,33 @@ from .image_processing import ImageProcessing
 from .image_handler import ImageHandler
 from .image_converter import ImageConverter
 from .background_remover import BackgroundRemover
+from .upload_store import UploadStore
 from enums.image_size import ImageSize
 from error.processing_error import ProcessingError
 
 logger = logging.getLogger(__name__)
 
+_SIZE_BY_VALUE = {size.value: size for size in ImageSize}
+
 
 class ImageUtilityBot:
     """Main bot class handling image processing workflows."""
 
+    # Both keyboards are immutable, so build them once
+    FORMAT_KEYBOARD = ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=str(i))] for i in range(1, 5)],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+    SIZE_KEYBOARD = ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=size.value)] for size in ImageSize],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+
+    # Chunk size for streaming Telegram downloads into memory
+    DOWNLOAD_CHUNK_SIZE = 1 << 20
+
     HELP_MESSAGE = """
     📚 Available commands:
     /start - Begin interaction
@@ -39,21 +60,55 @@ class ImageUtilityBot:
     def __init__(self, bot_instance: Bot, dispatcher: Dispatcher):
         self.bot = bot_instance
         self.dp = dispatcher
-        self.handlers: Dict[str, Type[ImageHandler]] = {
-            "1": lambda: ImageConverter("png"),
-            "2": lambda: ImageConverter("jpg"),
-            "3": lambda: ImageConverter("webp"),
-            "4": lambda: BackgroundRemover(),
+        self._configure_opencv()
+        # Handlers keep no per-request state, so one instance each is shared
+        self.handlers: Dict[str, ImageHandler] = {
+            "1": ImageConverter("png"),
+            "2": ImageConverter("jpg"),
+            "3": ImageConverter("webp"),
+            "4": BackgroundRemover(os.getenv("REMBG_MODEL", "u2netp")),
         }
+        # Bounds concurrent heavy jobs (rembg, resize, encode) to keep memory in check
+        self._job_sem = asyncio.Semaphore(int(os.getenv("MAX_CONCURRENT_JOBS", "3")))
+        self.max_upload_bytes = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+        # Uploads live here rather than in FSM storage, which never expires them
+        self.uploads = UploadStore(
+            ttl=float(os.getenv("UPLOAD_TTL_SECONDS", "600")),
+            max_bytes=int(
+                os.getenv("MAX_HELD_UPLOAD_BYTES", str(10 * self.max_upload_bytes))
+            ),
+        )
         self._configure_handlers()
 
+    @staticmethod
+    def _configure_opencv() -> None:
+        """Let OpenCV's resize/encode kernels use the available cores."""
+        cv2.setUseOptimized(True)
+        cv2.setNumThreads(max(1, (os.cpu_count() or 1) - 1))
+
+        build_info = cv2.getBuildInformation()
+        logger.debug(build_info)
+        framework = next(
+            (
+                line.split(":", 1)[1].strip()
+                for line in build_info.splitlines()
+                if line.strip().startswith("Parallel framework:")
+            ),
+            "",
+        )
+        if "pthreads" in framework:
+            logger.info(f"OpenCV using {cv2.getNumThreads()} threads ({framework})")
+        else:
+            logger.warning(
+                f"OpenCV parallel framework is '{framework or 'none'}', "
+                "not pthreads; resize may not scale across cores"
+            )
+
     # Command handlers
     def _configure_handlers(self) -> None:
         self.dp.message.register(self.start, Command("start"))
         self.dp.message.register(self.help_command, Command("help"))
-        self.dp.message.register(
-            self.handle_image, lambda msg: msg.photo or msg.document
-        )
+        self.dp.message.register(self.handle_image, F.photo | F.document)
         self.dp.message.register(
             self.handle_conversion_choice, ImageProcessing.selecting_action
         )
@@ -61,22 +116,6 @@ class ImageUtilityBot:
             self.handle_size_choice, ImageProcessing.selecting_size
         )
 
-    @staticmethod
-    def create_format_keyboard() -> ReplyKeyboardMarkup:
-        return ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text=str(i))] for i in range(1, 5)],
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        )
-
-    @staticmethod
-    def create_size_keyboard() -> ReplyKeyboardMarkup:
-        return ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text=size.value)] for size in ImageSize],
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        )
-
     # START [/start]
     async def start(self, message: types.Message) -> None:
         await message.answer(
@@ -95,7 +134,7 @@ class ImageUtilityBot:
     async def handle_image(self, message: types.Message, state: FSMContext) -> None:
         try:
             if message.document:
-                mime_type = message.document.mime_type
+                mime_type = message.document.mime_type or ""
                 if not mime_type.startswith("image/"):
                     await message.answer(
                         "❌ Please upload an image file (JPEG, PNG, WEBP, etc.)"
@@ -107,16 +146,24 @@ class ImageUtilityBot:
                     await message.answer(f"❌ Unsupported format: {format_type}")
                     return
 
+            # Reject oversized uploads before spending any download work on them
+            file = message.photo[-1] if message.photo else message.document
+            if file.file_size and file.file_size > self.max_upload_bytes:
+                await message.answer(
+                    f"❌ File is too large. Maximum size is "
+                    f"{self.max_upload_bytes // (1024 * 1024)} MB."
+                )
+                return
+
             wait_msg = await message.answer("⏳ Processing your image...")
             try:
-                file = message.photo[-1] if message.photo else message.document
-                file_path = await self.download_file(file)
-                if not file_path:
+                image_data = await self.download_file(file)
+                if not image_data:
                     raise ProcessingError("Failed to download file")
 
-                await state.update_data(file_path=file_path)
+                self.uploads.put(state.key, image_data)
                 await message.answer(
-                    "🔧 Choose operation:", reply_markup=self.create_format_keyboard()
+                    "🔧 Choose operation:", reply_markup=self.FORMAT_KEYBOARD
                 )
                 await state.set_state(ImageProcessing.selecting_action)
             finally:
@@ -141,7 +188,7 @@ class ImageUtilityBot:
 
             await state.update_data(format_choice=user_choice)
             await message.answer(
-                "📐 Choose output resolution:", reply_markup=self.create_size_keyboard()
+                "📐 Choose output resolution:", reply_markup=self.SIZE_KEYBOARD
             )
             await state.set_state(ImageProcessing.selecting_size)
         except Exception as e:
@@ -156,48 +203,44 @@ class ImageUtilityBot:
         data = await state.get_data()
         try:
             size_choice = message.text.strip()
-            try:
-                target_size = next(
-                    size for size in ImageSize if size.value == size_choice
-                )
-            except StopIteration:
+            target_size = _SIZE_BY_VALUE.get(size_choice)
+            if target_size is None:
                 await message.answer(
                     "❌ Invalid size choice. Please select from the keyboard options."
                 )
                 return
 
-            file_path = data.get("file_path")
+            image_data = self.uploads.pop(state.key)
+            if image_data is None:
+                raise ProcessingError("Upload expired, please send the image again")
             format_choice = data.get("format_choice")
-            if not all([file_path, format_choice]):
+            if not format_choice:
                 raise ProcessingError("Missing required processing data")
 
-            handler = self.handlers[format_choice]()
-            await handler.process(message, file_path, target_size)
+            handler = self.handlers[format_choice]
+            async with self._job_sem:
+                await handler.process(message, image_data, target_size)
         except Exception as e:
             error_msg = f"❌ Processing Error: {str(e)}"
             logger.error(error_msg)
             await message.answer(error_msg)
         finally:
+            self.uploads.pop(state.key)
             await state.clear()
-            if "file_path" in data:
-                await ImageHandler.cleanup_files(data["file_path"])
 
     # Return processed image to user to download
     async def download_file(
         self, file: types.PhotoSize | types.Document
-    ) -> Optional[str]:
+    ) -> Optional[bytes]:
         try:
             file_info = await self.bot.get_file(file.file_id)
-            ext = (
-                "jpg"
-                if isinstance(file, types.PhotoSize)
-                else file.mime_type.split("/")[-1].replace("jpeg", "jpg")
+            # Decoded straight from memory, so the upload never touches disk
+            buffer = io.BytesIO()
+            await self.bot.download_file(
+                file_info.file_path, buffer, chunk_size=self.DOWNLOAD_CHUNK_SIZE
             )
-            file_path = f"downloads/{file.file_id}.{ext}"
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            await self.bot.download_file(file_info.file_path, file_path)
-            logger.info(f"Successfully downloaded file to {file_path}")
-            return file_path
+            logger.info(f"Successfully downloaded file {file.file_id}")
+            return buffer.getvalue()
         except Exception as e:
             logger.error(f"Failed to download file: {e}")
             return None
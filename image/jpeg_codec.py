@@ -0,0 +1,102 @@
+import io
+import logging
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+except ImportError:
+    TurboJPEG = None
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+logger = logging.getLogger(__name__)
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+class JpegCodec:
+    """JPEG decode/encode straight through libjpeg-turbo.
+
+    Uses PyTurboJPEG when it and the libturbojpeg library are installed,
+    otherwise simplejpeg, which bundles its own libjpeg-turbo.
+    """
+
+    def __init__(self):
+        self._tj = None
+        if TurboJPEG is not None:
+            try:
+                self._tj = TurboJPEG()
+                logger.info("Using libjpeg-turbo (PyTurboJPEG) for JPEG")
+            except (RuntimeError, OSError) as e:
+                logger.warning(f"libturbojpeg unavailable: {e}")
+        if self._tj is None and simplejpeg is not None:
+            logger.info("Using libjpeg-turbo (simplejpeg) for JPEG")
+
+    @property
+    def available(self) -> bool:
+        return self._tj is not None or simplejpeg is not None
+
+    @staticmethod
+    def is_jpeg(data: bytes) -> bool:
+        return data.startswith(JPEG_MAGIC)
+
+    def header_size(self, data: bytes) -> Optional[Tuple[int, int]]:
+        """Return the (width, height) of JPEG bytes without decoding pixels."""
+        if not self.is_jpeg(data):
+            return None
+        try:
+            if self._tj is not None:
+                width, height, _, _ = self._tj.decode_header(data)
+                return width, height
+            if simplejpeg is not None:
+                height, width, _, _ = simplejpeg.decode_jpeg_header(data)
+                return width, height
+            with Image.open(io.BytesIO(data)) as img:
+                return img.size
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read JPEG header: {e}")
+            return None
+
+    def decode(self, data: bytes, scale_denom: int = 1) -> Optional[np.ndarray]:
+        """Decode JPEG bytes to BGR, or return None to let OpenCV handle them.
+
+        `scale_denom` (1, 2, 4 or 8) downscales inside the IDCT, which costs
+        far less than decoding at full size and resizing afterwards.
+        """
+        if not self.available or not self.is_jpeg(data):
+            return None
+        try:
+            if self._tj is not None:
+                return self._tj.decode(
+                    data, pixel_format=TJPF_BGR, scaling_factor=(1, scale_denom)
+                )
+            height, width, _, _ = simplejpeg.decode_jpeg_header(data)
+            return simplejpeg.decode_jpeg(
+                data,
+                colorspace="BGR",
+                min_height=height // scale_denom,
+                min_width=width // scale_denom,
+            )
+        except (OSError, ValueError) as e:
+            # e.g. CMYK/YCCK JPEGs, which OpenCV still decodes
+            logger.warning(f"libjpeg-turbo decode failed, falling back to OpenCV: {e}")
+            return None
+
+    def encode(self, image: np.ndarray, quality: int) -> Optional[bytes]:
+        """Encode a BGR image, or return None to let OpenCV handle it."""
+        if (
+            not self.available
+            or image.dtype != np.uint8
+            or image.ndim != 3
+            or image.shape[2] != 3
+        ):
+            return None
+        image = np.ascontiguousarray(image)
+        if self._tj is not None:
+            return self._tj.encode(image, quality=quality, pixel_format=TJPF_BGR)
+        return simplejpeg.encode_jpeg(image, quality=quality, colorspace="BGR")
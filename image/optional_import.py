@@ -0,0 +1,18 @@
+import functools
+import importlib
+from types import ModuleType
+from typing import Optional
+
+
+@functools.lru_cache(maxsize=None)
+def optional_import(name: str) -> Optional[ModuleType]:
+    """Import an optional backend the first time it is asked for.
+
+    Returns None when the module isn't installed. Heavy GPU stacks such as
+    torch are loaded through here by the first job that can use them rather
+    than at bot startup.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
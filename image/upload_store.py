@@ -0,0 +1,44 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class UploadStore:
+    """Uploads waiting for the user to pick an operation, with expiry and a size cap.
+
+    Flows that are abandoned mid-way never reach state.clear(), so their bytes
+    are dropped after `ttl` seconds, or earlier, oldest first, once more than
+    `max_bytes` are held.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._uploads: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+        self._held_bytes = 0
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        """Hold `data` for `key`, replacing any earlier upload for it."""
+        self.pop(key)
+        self._uploads[key] = (time.monotonic() + self.ttl, data)
+        self._held_bytes += len(data)
+        self._evict()
+
+    def pop(self, key: Hashable) -> Optional[bytes]:
+        """Return and drop the upload for `key`, or None if it expired."""
+        self._evict()
+        entry = self._uploads.pop(key, None)
+        if entry is None:
+            return None
+        self._held_bytes -= len(entry[1])
+        return entry[1]
+
+    def _evict(self) -> None:
+        # Entries are in insertion order, so expiry order too
+        now = time.monotonic()
+        while self._uploads:
+            expires_at, data = next(iter(self._uploads.values()))
+            if expires_at > now and self._held_bytes <= self.max_bytes:
+                break
+            self._uploads.popitem(last=False)
+            self._held_bytes -= len(data)
@@ -4,11 +4,12 @@ import logging
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
-from image.image_utility_bot import ImageUtilityBot  
 
-# Load environment variables
+# Load environment variables before the image modules read their settings
 load_dotenv()
 
+from image.image_utility_bot import ImageUtilityBot
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -28,9 +29,6 @@ async def main():
         # Create dispatcher with memory storage
         dp = Dispatcher(storage=MemoryStorage())
 
-        # Create downloads directory
-        os.makedirs("downloads", exist_ok=True)
-
         # Initialize and run the bot
         utility_bot = ImageUtilityBot(bot, dp)
         logger.info("Starting bot...")
@@ -0,0 +1,23 @@
+import cv2
+import numpy as np
+import pytest
+from enums.image_size import ImageSize
+from image.image_handler import ImageHandler
+
+
+@pytest.mark.parametrize("ext", [".jpg", ".png"])
+def test_reduced_decode_keeps_output_size(ext):
+    # A 12 MP phone photo at 1080p decodes at 1/2 scale as JPEG, but must
+    # come out the same size as the full decode of a PNG
+    ok, encoded = cv2.imencode(ext, np.zeros((3024, 4032, 3), np.uint8))
+    assert ok
+
+    image, source_size = ImageHandler.decode_image(
+        encoded.tobytes(), target_size=ImageSize.MEDIUM
+    )
+    resized = ImageHandler.resize_image(
+        image, ImageSize.MEDIUM, source_size=source_size
+    )
+
+    assert source_size == (4032, 3024)
+    assert resized.shape[:2] == (1440, 1920)